@@ -1,18 +1,30 @@
+from __future__ import annotations
+
 import argparse
+import sys
 
-from typing import Any
+from typing import TYPE_CHECKING
 
-BOOL_KWARGS: dict[str, Any]
+if TYPE_CHECKING:
+    from typing import Any
 
-try:
-    BOOL_KWARGS = {"type": bool, "action": argparse.BooleanOptionalAction}
-except (ImportError, AttributeError):
-    BOOL_KWARGS = {"action": "store_true"}
+# argparse.BooleanOptionalAction was added in Python 3.9
+BOOL_KWARGS: dict[str, Any] = (
+    {"type": bool, "action": argparse.BooleanOptionalAction}
+    if sys.version_info >= (3, 9)
+    else {"action": "store_true"}
+)
 
+# Built on first use by _parse_cmd_line
+_PARSER: argparse.ArgumentParser | None = None
 
-def _parse_cmd_line():
+# Parsed arguments, shared by every entry point calling _parse_cmd_line
+_ARGS_CACHE: dict[str, Any] | None = None
+
+
+def _build_parser() -> argparse.ArgumentParser:
     """
-    Helper for parsing CLI call and displaying help message
+    Register all the CLI arguments on a new parser
     """
     parser = argparse.ArgumentParser(description="Convert and upload corpus to LCP")
 
@@ -108,7 +120,41 @@ def _parse_cmd_line():
         **BOOL_KWARGS,
     )
 
-    kwargs = vars(parser.parse_args())
-    kwargs["content"] = kwargs.pop("input", "")
-    kwargs["template"] = kwargs.pop("json", False)
+    return parser
+
+
+def _parse_cmd_line():
+    """
+    Helper for parsing CLI call and displaying help message
+
+    The command line is only parsed once: subsequent calls return the same kwargs
+    """
+    global _ARGS_CACHE, _PARSER
+    if _ARGS_CACHE is not None:
+        return _ARGS_CACHE
+
+    if _PARSER is None:
+        _PARSER = _build_parser()
+
+    ns = _PARSER.parse_args()
+    kwargs = {
+        # CORPERT
+        "content": ns.input,
+        "output": ns.output,
+        "mode": ns.mode,
+        "extension": ns.extension,
+        "filter": ns.filter,
+        "lua_filter": ns.lua_filter,
+        "example": ns.example,
+        # LCPUPLOAD
+        "corpus": ns.corpus,
+        "api_key": ns.api_key,
+        "secret": ns.secret,
+        "project": ns.project,
+        "template": ns.json,
+        "live": ns.live,
+        "to": ns.to,
+        "check_only": ns.check_only,
+    }
+    _ARGS_CACHE = kwargs
     return kwargs
@@ -9,9 +9,8 @@ from .parsers.tei import TEIParser
 from .parsers.json import JSONParser
 
 from .cli import _parse_cmd_line
-from .utils import default_json
+from .utils import default_json, WRITE_BUFFER_SIZE
 
-from jsonschema import validate
 from pathlib import Path
 
 # map between extensions and parsers
@@ -202,6 +201,8 @@ class Corpert:
         # docs = []
 
         if self.mode == "upload":
+            from jsonschema import validate
+
             ignore_files = set()
             json_obj = None
             json_file = next(
@@ -343,8 +344,9 @@ class Corpert:
                 doc_id_idx = 0
                 start_idx = 0
                 end_idx = 0
+                # One output row per input row: buffer like the parser's tables
                 with open(os.path.join(self._path, fn), "r") as input_file, open(
-                    os.path.join(output_path, fn), "w"
+                    os.path.join(output_path, fn), "w", buffering=WRITE_BUFFER_SIZE
                 ) as output_file:
                     while input_line := input_file.readline():
                         input_cols = input_line.rstrip("\n").split("\t")
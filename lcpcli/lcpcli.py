@@ -3,12 +3,15 @@ import shutil
 
 from collections.abc import Callable
 from inspect import signature
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from .corpert import Corpert
-from .lcp_upload import lcp_upload
 from .cli import _parse_cmd_line
 
+# Corpert and lcp_upload pull in the parsers and the HTTP stack:
+# only import them once we know the command line needs them
+if TYPE_CHECKING:
+    from .corpert import Corpert
+
 
 class Lcpcli:
 
@@ -55,6 +58,8 @@ then `lcpcli -c {output_path} -k $API_KEY -s $API_SECRET -p $PROJECT_NAME --live
         corpert: Corpert | None = None
 
         if cont := self.kwargs.get("content"):
+            from .corpert import Corpert
+
             self.kwargs["content"] = os.path.abspath(cont)
             corpert = Corpert(**self._get_kwargs(Corpert.__init__))
             corpert.run()
@@ -81,6 +86,8 @@ then `lcpcli -c {output_path} -k $API_KEY -s $API_SECRET -p $PROJECT_NAME --live
         if not self.kwargs.get("corpus"):
             raise ValueError("No corpus found to upload")
 
+        from .lcp_upload import lcp_upload
+
         return lcp_upload(**self._get_kwargs(lcp_upload))
 
 
@@ -12,13 +12,13 @@ TODO: update meta.json when new attributes are discovered
 
 import abc
 import json
+import mmap
 import os
 import re
 
 from ..utils import (
     is_time_anchored,
     get_ci,
-    Info,
     Table,
     TokenTable,
     LookupTable,
@@ -30,8 +30,17 @@ from ..utils import (
     Text,
     Sentence,
     NestedSet,
+    SegmentDeps,
 )
 
+# Document-level metadata lines in CoNLL-U: "# newdoc key = value"
+_NEWDOC_RE = re.compile(r"^# newdoc (.*?) = (.*)$", re.MULTILINE)
+# Runs of non-empty lines, i.e. the sentences of a CoNLL-U document
+_SENT_RE = re.compile(r"[^\n]+(?:\n[^\n]+)*")
+
+# Shared default for documents without media, rather than a new Meta per document
+_DUMMY_MEDIA = Meta("dummy", {})
+
 
 class Parser(abc.ABC):
     def __init__(self, *args, **kwargs):
@@ -41,6 +50,11 @@ class Parser(abc.ABC):
         self._tables = {}
         self.doc_frames = {}
         self.config = kwargs.get("config", {})
+        self._layers_ci = {}
+        # Lowercased table key of each layer listed in firstClass
+        self._first_class_lc = {
+            k: v.lower() for k, v in self.config.get("firstClass", {}).items()
+        }
 
     @abc.abstractmethod
     def parse(self, content):
@@ -79,24 +93,25 @@ class Parser(abc.ABC):
         """
         pass
 
+    def layer_ci(self, name):
+        """
+        Case-insensitive get of a layer from the config, cached by name
+        """
+        if name not in self._layers_ci:
+            self._layers_ci[name] = get_ci(self.config["layer"], name)
+        return self._layers_ci[name]
+
     def compute_doc(self, content, first_sentence, last_sentence):
         """
         Return (doc_id,char_range,meta) for a given pair of first and last sentences
         """
-        meta_obj = {}
-        start_idx = re.search(self.start_idx, first_sentence)[0]
-        end_idx = re.search(self.end_idx, last_sentence)[0]
+        # start_idx and end_idx are compiled by the subclasses
+        start_idx = self.start_idx.search(first_sentence)[0]
+        end_idx = self.end_idx.search(last_sentence)[0]
         char_range = f"{start_idx},{end_idx}"
 
-        # meta_lines = [line for line in content.split("\n\n") if line.startswith("# text")]
-        meta_lines = [
-            line for line in content.split("\n") if line.startswith("# newdoc ")
-        ]
-        for line in meta_lines:
-            if " = " not in line:
-                continue
-            k, v = line.split(" = ")
-            meta_obj[k[9:].strip()] = v.strip()
+        # Scan the content in place: no per-line list of the whole document
+        meta_obj = {m[1].strip(): m[2].strip() for m in _NEWDOC_RE.finditer(content)}
 
         # if "text_id" in meta_obj:
         if "id" in meta_obj:
@@ -115,11 +130,11 @@ class Parser(abc.ABC):
         col_names = [f"{doc_name}_id", "char_range"]
         cols = [
             str(table.cursor),
-            f"[{str(doc.char_range_start)},{str(self.char_range_cur-1)})",
+            f"[{doc.char_range_start},{self.char_range_cur-1})",
         ]
         if doc.frame_range[1] != 0:
             col_names.append("frame_range")
-            cols.append(f"[{str(doc.frame_range[0])},{str(doc.frame_range[1])})")
+            cols.append(f"[{doc.frame_range[0]},{doc.frame_range[1]})")
             doc_frame_id = str(meta._value.get("name", doc.id) if meta else doc.id)
             self.doc_frames[doc_frame_id] = [*doc.frame_range]
         name_doc = str(table.cursor)
@@ -137,7 +152,7 @@ class Parser(abc.ABC):
             cols.append(str(attr.value).strip())
         media_slots = self.config.get("meta", {}).get("mediaSlots", {})
         if media_slots:
-            media = doc.attributes.get("media", Meta("dummy", {})).value
+            media = doc.attributes.get("media", _DUMMY_MEDIA).value
             for name, attribs in media_slots.items():
                 assert (
                     attribs.get("isOptional") is not False or name in media
@@ -160,19 +175,22 @@ class Parser(abc.ABC):
         """
         # head_id is None: this is a new head, process the previous one
         empty_segments = []
-        for segment_id, tokens in table.deps.items():
+        for segment_id, segment_deps in table.deps.items():
             if segment_id == working_on:
                 continue
             nested_set_of_previous_head = None
-            tokens = {k: v for k, v in tokens.items() if not isinstance(k, Info)}
-            for token_id, attrs in tokens.items():
-                # Link the nested sets from the dependencies in memory
-                hid = attrs["head_id"]
+            token_ids = segment_deps.token_ids
+            id_to_idx = segment_deps.positions
+            nested_sets = segment_deps.nested_sets
+            head_ids = segment_deps.head_ids
+            # Link the nested sets from the dependencies in memory
+            for i, hid in enumerate(head_ids):
                 if hid == "":
-                    nested_set_of_previous_head = attrs["nested_set"]
-                if hid not in tokens:
+                    nested_set_of_previous_head = nested_sets[i]
+                h = id_to_idx.get(hid, -1)
+                if h < 0:
                     continue
-                tokens[hid]["nested_set"].add(tokens[token_id]["nested_set"])
+                nested_sets[h].add(nested_sets[i])
             anchor_right = table.anchor_right
             try:
                 assert nested_set_of_previous_head, AssertionError(
@@ -183,8 +201,9 @@ class Parser(abc.ABC):
             if nested_set_of_previous_head.consumed:
                 continue
             nested_set_of_previous_head.compute_anchors()
-            for id in nested_set_of_previous_head.all_ids:
-                nested_set = tokens[id]["nested_set"]
+            all_ids = nested_set_of_previous_head.all_ids
+            for id in all_ids:
+                nested_set = nested_sets[id_to_idx[id]]
                 if nested_set.consumed:
                     continue
                 parent_id = (
@@ -195,7 +214,7 @@ class Parser(abc.ABC):
                 table.write(
                     [
                         str(parent_id),  # head
-                        str(str(nested_set.cursor_id)),  # dependent (self)
+                        str(nested_set.cursor_id),  # dependent (self)
                         nested_set.label,  # label
                         str(anchor_right + nested_set.left),  # left_anchor
                         str(anchor_right + nested_set.right),  # right_anchor
@@ -204,10 +223,8 @@ class Parser(abc.ABC):
                 nested_set.consumed = True
             table.anchor_right = anchor_right + nested_set_of_previous_head.right
             nested_set_of_previous_head.consumed = True
-            # Now clear the processed tokens
-            for id in nested_set_of_previous_head.all_ids:
-                tokens.pop(id)
-            if not tokens:
+            # The segment is done once the head's tree covers all of its tokens
+            if len(all_ids) == len(token_ids):
                 empty_segments.append(segment_id)
         # Clear the segments with no tokens left
         for s_id in empty_segments:
@@ -218,27 +235,32 @@ class Parser(abc.ABC):
         assert isinstance(attribute, Text), TypeError(
             f"Foreign key '{attribute.name}' should be a simple text"
         )
-        layer_name = next(
-            (x for x in self.config.get("layer", {}).keys() if x.lower() == aname_low),
-            None,
-        )
-        layer_attributes = (
-            self.config["layer"].get(layer_name, {}).get("attributes", {})
-            if layer_name
-            else {}
-        )
+        layer_config = self.layer_ci(aname_low)
+        layer_attributes = layer_config.get("attributes", {})
         contained_entity = aligned_entities[aname_low]["properties"].get("contains", "")
         has_frame_range = is_time_anchored(
             self.config["layer"].get(contained_entity, {}), self.config
         )
         # Create a table for the entity if it doesn't exist yet
         if aname_low not in self._tables:
-            self._tables[aname_low] = Table(
-                aname_low, path, config=get_ci(self.config["layer"], layer_name)
-            )
+            self._tables[aname_low] = Table(aname_low, path, config=layer_config)
             table = self._tables[aname_low]
-            with open(aligned_entities[aname_low]["fn"], "r") as aligned_file:
-                table.col_names = aligned_file.readline().rstrip().split("\t")[1:]
+            with open(aligned_entities[aname_low]["fn"], "rb") as aligned_file:
+                # The mapping stays valid after the file is closed
+                aligned_map = mmap.mmap(
+                    aligned_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+                table.source = aligned_map
+                header = aligned_map.readline().decode("utf-8")
+                table.col_names = header.rstrip().split("\t")[1:]
+                # Locate each row by ID once instead of scanning the file per entity
+                offsets = table.source_offsets
+                start = aligned_map.tell()
+                while line := aligned_map.readline():
+                    end = start + len(line)
+                    row_id = line.split(b"\t", 1)[0].strip().decode("utf-8")
+                    offsets.setdefault(row_id, (start, end))
+                    start = end
                 entity_col_names = [f"{aname_low}_id"]
                 for cn in table.col_names:
                     attribute_props = layer_attributes.get(cn, None)
@@ -250,6 +272,8 @@ class Parser(abc.ABC):
                         lookup_table = LookupTable(aname_low, cn, path, self.config)
                         self._tables[f"{aname_low}_{cn}"] = lookup_table
                     else:
+                        if attribute_props.get("type", "") == "labels":
+                            table.label_columns.append(len(entity_col_names))
                         entity_col_names.append(cn)
                 entity_col_names.append("char_range")
                 if has_frame_range:
@@ -271,21 +295,20 @@ class Parser(abc.ABC):
                     ctype = layer_attributes.get(col_name, {}).get("type", "")
                     if ctype != "labels":
                         continue
-                    bits = int("0", 2)
+                    bits = 0
                     for label in entity_cols[n].split(","):
-                        l = label.strip()
-                        idx = lbls.get(l, len(lbls))
-                        lbls[l] = idx
-                        bs = "1" + "".join(["0" for _ in range(idx - 1)])
-                        bits = bits | int(bs, 2)
-                    entity_cols[n] = bin(bits)[2:]
+                        idx = lbls.setdefault(label.strip(), len(lbls))
+                        # Label n sets bit n, as listed in *_labels.csv
+                        bits |= 1 << idx
+                    # Formatted to the final number of labels in close_upload_files
+                    entity_cols[n] = bits
                 range_up = self.char_range_cur - 1  # Stop just before this entity
                 if range_up <= int(ce["range_low"]):
                     range_up = int(ce["range_low"]) + 1
                 cols_to_write = [
                     table.cursor,
                     *entity_cols,
-                    f"[{str(ce['range_low'])},{str(range_up)})",
+                    f"[{ce['range_low']},{range_up})",
                 ]
                 if has_frame_range:
                     lower_frame_range, upper_frame_range = (
@@ -294,10 +317,11 @@ class Parser(abc.ABC):
                     )
                     if upper_frame_range <= lower_frame_range:
                         upper_frame_range = lower_frame_range + 1
-                    cols_to_write.append(
-                        f"[{str(lower_frame_range)},{str(upper_frame_range)})"
-                    )
-                table.write(cols_to_write)
+                    cols_to_write.append(f"[{lower_frame_range},{upper_frame_range})")
+                if table.label_columns:
+                    table.pending_rows.append(cols_to_write)
+                else:
+                    table.write(cols_to_write)
                 table.cursor += 1
             # Create an empty entity dict if no ID was provided
             if not fk or fk.strip() == "_":
@@ -305,39 +329,34 @@ class Parser(abc.ABC):
             else:
                 ce = {"id": fk}
                 # Read the content of the entity from the provided file
-                with open(aligned_entities[aname_low]["fn"], "r") as aligned_file:
-                    while True:
-                        line = aligned_file.readline()
-                        if not line:
-                            break
-                        line = line.split("\t")
-                        if line[0].strip() == fk:
-                            ce["cols"] = []
-                            for n, col in enumerate(line[1:]):
-                                col_name = table.col_names[n]
-                                attr_name = next(
-                                    (
-                                        x
-                                        for x in layer_attributes
-                                        if x.lower() == col_name
-                                        or x.lower() + "_id" == col_name
-                                    ),
-                                    col_name,
-                                )
-                                ctype = layer_attributes.get(attr_name, {}).get("type")
-                                if ctype == "text":
-                                    lookup_table = self._tables[
-                                        f"{aname_low}_{col_name}"
-                                    ]
-                                    ce["cols"].append(lookup_table.get_id(col.strip()))
-                                else:
-                                    ce["cols"].append(col.strip())
-                                if ctype == "categorical":
-                                    if attr_name not in table.categorical_values:
-                                        table.categorical_values[attr_name] = set()
-                                    table.categorical_values[attr_name].add(col.strip())
-                            ce["range_low"] = str(self.char_range_cur)
-                            break
+                offset = table.source_offsets.get(fk)
+                if offset is not None:
+                    start, end = offset
+                    line = table.source[start:end].decode("utf-8")
+                    ce["cols"] = []
+                    for n, col in enumerate(line.split("\t")[1:]):
+                        col_name = table.col_names[n]
+                        attr_name = next(
+                            (
+                                x
+                                for x in layer_attributes
+                                if x.lower() == col_name
+                                or x.lower() + "_id" == col_name
+                            ),
+                            col_name,
+                        )
+                        ctype = layer_attributes.get(attr_name, {}).get("type")
+                        col = col.strip()
+                        if ctype == "text":
+                            lookup_table = self._tables[f"{aname_low}_{col_name}"]
+                            ce["cols"].append(lookup_table.get_id(col))
+                        else:
+                            ce["cols"].append(col)
+                        if ctype == "categorical":
+                            table.categorical_values.setdefault(attr_name, set()).add(
+                                col
+                            )
+                    ce["range_low"] = str(self.char_range_cur)
                 if has_frame_range:
                     ce["frame_range_start"] = str(self.frame_range_cur)
             table.current_entity = ce
@@ -354,52 +373,66 @@ class Parser(abc.ABC):
             return
         # Close the files
         for n, tab in self._tables.items():
+            if tab.labels:
+                # Write the labels
+                nlabels = len(tab.labels)
+                with open(os.path.join(path, f"{n}_labels.csv"), "w") as f:
+                    f.write("\t".join(["bit", "label"]) + "\n")
+                    for l, i in tab.labels.items():
+                        f.write("\t".join([str(i), str(l)]) + "\n")
+                tab.config["nlabels"] = nlabels
+            tab.flush()
+            # Rows with labels were held until now: pad 0s to match the bit length
+            bits_format = f"0{len(tab.labels)}b"
+            for row in tab.pending_rows:
+                for col in tab.label_columns:
+                    row[col] = format(row[col], bits_format)
+                tab.write(row)
+            tab.pending_rows.clear()
             tab.file.close()
-            if not tab.labels:
-                continue
-            # Write the labels
-            nlabels = len(tab.labels)
-            with open(os.path.join(path, f"{n}_labels.csv"), "w") as f:
-                f.write("\t".join(["bit", "label"]) + "\n")
-                for l, i in tab.labels.items():
-                    f.write("\t".join([str(i), str(l)]) + "\n")
-            tab.config["nlabels"] = nlabels
-            # Pad 0s to match the bit length
-            label_attributes = {}
-            for n, v in tab.config.get("attributes", {}).items():
-                # List all the attributes of type "labels"
-                if v.get("type") != "labels":
-                    continue
-                label_attributes[n] = -1
-            if not label_attributes:
-                continue
-            with open(tab.path, "r") as input, open(tab.path + ".tmp", "w") as output:
-                while True:
-                    il = input.readline()
-                    if not il:
-                        break
-                    il = il.rstrip()
-                    cols = il.split("\t")
-                    if next(x for x in label_attributes.values()) == -1:
-                        # First line = header
-                        for n, c in enumerate(cols):
-                            for la in label_attributes:
-                                if not c.lower().startswith(la.lower()):
-                                    continue
-                                # Report the index of the column corresponding to the attribute
-                                label_attributes[la] = n
-                    else:
-                        # Not first line = row
-                        for n in label_attributes.values():
-                            bits = cols[n]
-                            if len(bits) < nlabels:
-                                bits = (
-                                    "".join(["0" for _ in range(nlabels - len(bits))])
-                                    + bits
-                                )
-                            cols[n] = bits
-                    output.write("\t".join(cols) + "\n")
-            os.rename(tab.path + ".tmp", tab.path)
+            if tab.source is not None:
+                tab.source.close()
+                tab.source = None
+
+    @staticmethod
+    def attribute_kind(attr_name, attribute, aligned_entities={}):
+        """
+        Tell how to process the values of a token attribute, judging from one of them
+        """
+        if attr_name.lower() in aligned_entities and isinstance(attribute, Text):
+            return "aligned"
+        if isinstance(attribute, Categorical):
+            return "categorical"
+        if isinstance(attribute, (Text, Meta)):
+            return "lookup"
+        if isinstance(attribute, Dependency):
+            return "dependency"
+        return None
+
+    def attribute_table(self, kind, attribute, tok_name, path="./", config={}):
+        """
+        Get, or create, the table receiving the values of a token attribute
+        """
+        if kind == "lookup":
+            name = f"{tok_name}_{attribute.name}"
+            if name not in self._tables:
+                self._tables[name] = LookupTable(tok_name, attribute.name, path, config)
+        elif kind == "dependency":
+            name = attribute.name
+            if name not in self._tables:
+                self._tables[name] = Table(name, path)
+                self._tables[name].write(
+                    [
+                        "head",
+                        "dependent",
+                        "udep",
+                        "left_anchor",
+                        "right_anchor",
+                    ]
+                )
+        else:
+            return None
+        return self._tables[name]
 
     def generate_upload_files_generator(
         self,
@@ -422,15 +455,9 @@ class Parser(abc.ABC):
             tok_name = config["firstClass"].get("token", tok_name).lower()
 
         self._tables = self._tables or {
-            "document": Table(
-                doc_name, path, config=get_ci(self.config["layer"], doc_name)
-            ),
-            "segment": Table(
-                seg_name, path, config=get_ci(self.config["layer"], doc_name)
-            ),
-            "token": TokenTable(
-                tok_name, path, config=get_ci(self.config["layer"], doc_name)
-            ),
+            "document": Table(doc_name, path, config=self.layer_ci(doc_name)),
+            "segment": Table(seg_name, path, config=self.layer_ci(doc_name)),
+            "token": TokenTable(tok_name, path, config=self.layer_ci(doc_name)),
         }
         token_table = self._tables["token"]
         char_range_start = self.char_range_cur
@@ -461,7 +488,10 @@ class Parser(abc.ABC):
             # List only the token attributes that are not null on every row
             non_null_attributes = token_table.non_null_attributes
             if not non_null_attributes and token_table.cursor == 1:
-                col_names = {f"{tok_name}_id": None}
+                col_names = [f"{tok_name}_id"]
+                # Every token repeats the same attributes: only list each column once
+                seen_cols = {col_names[0]}
+                first_attributes = {}
                 for token in segment.tokens:
                     if token.frame_range:
                         has_frame_range = True
@@ -469,6 +499,7 @@ class Parser(abc.ABC):
                         if not attr_value.value:
                             continue
                         non_null_attributes[attr_name] = True
+                        first_attributes.setdefault(attr_name, attr_value)
                         # Dependencies and references to aligned entities will be processed separately; do not list
                         if (
                             isinstance(attr_value, Dependency)
@@ -477,43 +508,60 @@ class Parser(abc.ABC):
                             continue
                         # Attributes of type Text and Meta use foreign keys
                         if any(isinstance(attr_value, klass) for klass in (Text, Meta)):
-                            col_names[attr_name + "_id"] = None
+                            col_name = attr_name + "_id"
                         else:
-                            col_names[attr_name] = None
+                            col_name = attr_name
+                        if col_name not in seen_cols:
+                            seen_cols.add(col_name)
+                            col_names.append(col_name)
                 token_table.non_null_attributes = non_null_attributes
-                col_names["char_range"] = None
+                token_table.non_null_lower = {a.lower() for a in non_null_attributes}
+                # Decide once how to process each attribute and which table receives it
+                token_table.attribute_plan = []
+                for a in non_null_attributes:
+                    first = first_attributes[a]
+                    kind = self.attribute_kind(a, first, aligned_entities)
+                    table = self.attribute_table(kind, first, tok_name, path, config)
+                    token_table.attribute_plan.append((a, kind, table))
+                col_names.append("char_range")
                 if has_frame_range:
-                    col_names["frame_range"] = None
-                col_names[f"{seg_name}_id"] = None
-                token_table.write([c for c in col_names])
-
-            print(
-                "segment",
-                segment.id,
-                "meta",
-                segment.attributes.get("meta", Meta("dummy", "dummy")).value,
-            )
+                    col_names.append("frame_range")
+                col_names.append(f"{seg_name}_id")
+                token_table.write(col_names)
+
+            if self.config.get("debug"):
+                segment_meta = segment.attributes.get("meta")
+                print(
+                    "segment",
+                    segment.id,
+                    "meta",
+                    segment_meta.value if segment_meta is not None else "",
+                )
+            # Aligned entities that no token attribute refers to: close any pending one
+            aligned_to_close = [
+                a for a in aligned_entities if a not in token_table.non_null_lower
+            ]
             for token in segment.tokens:
-                cols = [str(token_table.cursor)]
-                for attr_name in non_null_attributes:
+                # Build the encoded row directly rather than formatting a list of str
+                row = bytearray(b"%d" % token_table.cursor)
+                for attr_name, kind, table in token_table.attribute_plan:
                     attribute = token.attributes.get(attr_name, None)
-                    aname_low = attr_name.lower()
 
                     if attribute is None:
-                        cols.append("")
+                        row += b"\t"
                         continue
 
                     # For example, named_entity
-                    if aname_low in aligned_entities and isinstance(attribute, Text):
+                    if kind == "aligned":
                         self.aligned_entity(token, path, attribute, aligned_entities)
 
                     # For example, xpos
-                    elif isinstance(attribute, Categorical):
-                        cols.append(str(attribute.value))
-                        if attr_name not in token_table.categorical_values:
-                            token_table.categorical_values[attr_name] = set()
-                        token_table.categorical_values[attr_name].add(
-                            str(attribute.value)
+                    elif kind == "categorical":
+                        value = str(attribute.value)
+                        row += b"\t"
+                        row += token_table.encode_value(value)
+                        token_table.categorical_values.setdefault(attr_name, set()).add(
+                            value
                         )
 
                     # For example, form
@@ -523,63 +571,38 @@ class Parser(abc.ABC):
                     # - once the dict's length passes a certain threshold (e.g. 10k diff entries)
                     #   then start writing entries to self._tables whose name start with the text's first letter
                     # - if a text is not found in the dict, look up the file, and if not found in the file, write to it
-                    elif any(isinstance(attribute, klass) for klass in (Text, Meta)):
-                        name = f"{tok_name}_{attribute.name}"
-                        if name not in self._tables:
-                            self._tables[name] = LookupTable(
-                                tok_name, attribute.name, path, config
-                            )
-                        table = self._tables[name]
-                        text = str(attribute.value)
-                        id = table.get_id(text)
-                        cols.append(str(id))
+                    elif kind == "lookup":
+                        row += b"\t%d" % table.get_int_id(attribute.value)
 
                     # For example, head
-                    elif isinstance(attribute, Dependency):
+                    elif kind == "dependency":
                         # token_have_dependencies = True
-                        name = attribute.name
-                        if name not in self._tables:
-                            self._tables[name] = Table(name, path)
-                            self._tables[name].write(
-                                [
-                                    "head",
-                                    "dependent",
-                                    "udep",
-                                    "left_anchor",
-                                    "right_anchor",
-                                ]
-                            )
-                        table = self._tables[name]
-                        if str(segment.id) not in table.deps:
-                            info = Info(segment=segment, document=doc)
-                            table.deps[str(segment.id)] = {info: None}
-                        deps = table.deps[str(segment.id)]
+                        segment_key = str(segment.id)
+                        deps = table.deps.get(segment_key)
+                        if deps is None:
+                            deps = SegmentDeps(segment=segment, document=doc)
+                            table.deps[segment_key] = deps
                         head_id = attribute.value
                         # We assume a new head necessarily means all of the previous head's dependencies have been parsed
-                        if head_id == "" and deps:
+                        if head_id == "":
                             # head_id is None: this is a new head, process the previous one
-                            self.write_token_deps(
-                                self._tables[name], working_on=str(segment.id)
-                            )
-                        deps[token.id] = {
-                            "head_id": head_id,
-                            "nested_set": NestedSet(
-                                token.id, attribute.label, token_table.cursor
-                            ),
-                        }
-                        self._tables[name].cursor += 1
+                            self.write_token_deps(table, working_on=segment_key)
+                        deps.set(
+                            token.id,
+                            head_id,
+                            NestedSet(token.id, attribute.label, token_table.cursor),
+                        )
+                        table.cursor += 1
 
                 # If this token doesn't have an attribute for an aligned entity, close any pending one
-                for aligned_entity in aligned_entities:
-                    if aligned_entity in [a.lower() for a in non_null_attributes]:
-                        continue
+                for aligned_entity in aligned_to_close:
                     self.close_aligned_entity(aligned_entity, path, aligned_entities)
 
                 left_char_range = self.char_range_cur
                 self.char_range_cur += len(token.attributes["form"].value) - (
                     0 if token.spaceAfter else 1
                 )
-                cols.append(f"[{str(left_char_range)},{str(self.char_range_cur)})")
+                row += b"\t[%d,%d)" % (left_char_range, self.char_range_cur)
                 self.char_range_cur += 1
                 if token.frame_range:
                     has_frame_range = True  # Keep it here too for iterations where non_null_attributes is already set
@@ -588,7 +611,7 @@ class Parser(abc.ABC):
                     right_frame_range += offset_frame_range
                     if right_frame_range <= left_frame_range:
                         right_frame_range = left_frame_range + 1
-                    cols.append(f"[{str(left_frame_range)},{str(right_frame_range)})")
+                    row += b"\t[%d,%d)" % (left_frame_range, right_frame_range)
                     if current_document:
                         current_document.frame_range[1] = (
                             offset_frame_range + token.frame_range[1]
@@ -598,9 +621,13 @@ class Parser(abc.ABC):
                             offset_frame_range + token.frame_range[0]
                         )
                     self.frame_range_cur = right_frame_range
-                cols.append(str(segment.id))
-                token_table.write(cols)
+                row += b"\t"
+                row += token_table.encode_value(str(segment.id))
+                row += b"\n"
+                token_table.queue_line(row)
                 token_table.cursor += 1
+            # One write for all the tokens of the segment
+            token_table.flush()
 
             segment_table = self._tables["segment"]
             if segment_table.cursor == 1:
@@ -619,22 +646,22 @@ class Parser(abc.ABC):
                 frame_range_segment_end = self.frame_range_cur
                 if frame_range_segment_end <= frame_range_segment_start:
                     frame_range_segment_end = frame_range_segment_start + 1
-                cols.append(
-                    f"[{str(frame_range_segment_start)},{str(frame_range_segment_end)})"
-                )
+                cols.append(f"[{frame_range_segment_start},{frame_range_segment_end})")
             # Add all segment attributes
             for a in segment.attributes.values():
                 aname_low = a.name.lower()
                 if aname_low in aligned_entities_segment:
                     self.aligned_entity(segment, path, a, aligned_entities_segment)
                 else:
-                    cols.append(a.value)
-                    if a.name not in segment_table.categorical_values:
-                        segment_table.categorical_values[a.name] = set()
-                    segment_table.categorical_values[a.name].add(str(a.value))
+                    value = a.value
+                    cols.append(value)
+                    segment_table.categorical_values.setdefault(a.name, set()).add(
+                        value
+                    )
             # If this segment doesn't have an attribute for one the aligned entities, close it
+            segment_attributes_lower = {a.lower() for a in segment.attributes}
             for aligned_entity in aligned_entities_segment:
-                if aligned_entity in [a.lower() for a in segment.attributes.keys()]:
+                if aligned_entity in segment_attributes_lower:
                     continue
                 self.close_aligned_entity(
                     aligned_entity, path, aligned_entities_segment
@@ -650,27 +677,46 @@ class Parser(abc.ABC):
                 if name not in self._tables:
                     self._tables[name] = Table(name, path)
                 fts_table = self._tables[name]
-                vector = []
+                # Accumulate the encoded lexemes, each followed by a space
+                vector = bytearray()
+                # Lexeme prefixes: dependencies count twice, so plan for 2 per attribute
+                prefixes = [f"'{i}" for i in range(1, 2 * len(non_null_attributes) + 1)]
                 for n, token in enumerate(segment.tokens, start=1):
-                    attributes_to_fts = []
+                    values = []
                     for an in non_null_attributes:
                         a = token.attributes[an]
                         if (
                             any(isinstance(a, k) for k in (Categorical, Text))
                             and an.lower() not in aligned_entities
                         ):
-                            attributes_to_fts.append(a)
+                            copies = 1
                         elif isinstance(
                             a, Dependency
                         ):  # same value for LABEL_IN and LABELS_OUT
-                            attributes_to_fts.append(a)
-                            attributes_to_fts.append(a)
-                    for i, a in enumerate(attributes_to_fts, start=1):
-                        vector.append(f"'{i}{str(a.value)}':{n}")
-                cols[1:] = [" ".join(vector)]
+                            copies = 2
+                        else:
+                            continue
+                        # Escape quotes and backslashes like Sentence's FTS vector
+                        value = Sentence._esc(a.value)
+                        values += [value] * copies
+                    if not values:
+                        continue
+                    # Format the token's position once for all of its lexemes
+                    position = f"':{n}"
+                    vector += "".join(
+                        f"{prefix}{value}{position} "
+                        for prefix, value in zip(prefixes, values)
+                    ).encode("utf-8")
+                row = bytearray(fts_table.encode_value(str(cols[0])))
+                row += b"\t"
+                if vector:
+                    # Lexemes always contain quotes: quote the column like format_row
+                    quote = fts_table.quote_bytes
+                    row += quote + vector[:-1] + quote
+                row += b"\n"
                 if fts_table.cursor == 1:
                     fts_table.write([f"{seg_name}_id", "vector"])
-                fts_table.write(cols)
+                fts_table.write_line(row)
                 fts_table.cursor += 1
 
         if token_have_dependencies:
@@ -680,11 +726,10 @@ class Parser(abc.ABC):
                     continue
                 self.write_token_deps(tab)
 
-        # Add any pending aligned entities
-        for ename in aligned_entities:
-            self.close_aligned_entity(ename, path, aligned_entities)
-        for ename in aligned_entities_segment:
-            self.close_aligned_entity(ename, path, aligned_entities_segment)
+        # Add any pending aligned entities, token-level then segment-level
+        for entities in (aligned_entities, aligned_entities_segment):
+            for ename in entities:
+                self.close_aligned_entity(ename, path, entities)
 
         if current_document is None:
             # No new document marker found when parsing: create an all-encompassing one
@@ -699,21 +744,20 @@ class Parser(abc.ABC):
         )
 
         for l, lp in self.config["layer"].items():
-            table_key = next(
-                (v for k, v in self.config["firstClass"].items() if k == l), l
-            ).lower()
-            if table_key not in self._tables:
+            table = self._tables.get(self._first_class_lc.get(l, l.lower()))
+            if table is None:
                 continue
+            values_by_attribute = table.categorical_values
             for a, ap in lp.get("attributes", {}).items():
-                categorical_values = self._tables[table_key].categorical_values.get(a)
+                if ap.get("type") != "categorical" or ap.get("isGlobal"):
+                    continue
+                categorical_values = values_by_attribute.get(a)
                 if not categorical_values:
                     continue
-                if ap.get("type") == "categorical" and not ap.get("isGlobal"):
-                    ap["values"] = ap.get("values", [])
-                    for v in categorical_values:
-                        if v in ap["values"]:
-                            continue
-                        ap["values"].append(v)
+                # Keep the configured values first, then add the new ones in order
+                ap["values"] = list(
+                    dict.fromkeys([*ap.get("values", []), *categorical_values])
+                )
 
         # for _, v in self._tables.items():
         #     v['file'].close()
@@ -723,24 +767,28 @@ class Parser(abc.ABC):
         Return ([sentences], (doc_id,char_range,meta)) for a given document file
         """
 
-        sentences = (sent for sent in content.split("\n\n") if sent)
+        sentences = (m[0] for m in _SENT_RE.finditer(content))
 
         proc_sentences = []
 
         ncols = 0
+        # Sentences must be processed in order: each one advances the parser's
+        # offsets, word and segment counters, and the ids given to new values
         for sentence in sentences:
-            lines = [x for x in sentence.split("\n") if x]
+            lines = sentence.split("\n")
 
             sent = Sentence(lines, self)
             if sent._lines:
                 sent.process()
                 proc_sentences.append(sent)
-                ncols = max([ncols, *[len(l) for l in sent.proc_lines]])
+                ncols = max(ncols, sent.max_cols)
 
+        # Callers expect lines of the same length: pad those that are shorter
         for s in proc_sentences:
+            if s.min_cols == ncols:
+                continue
             for l in s.proc_lines:
-                for _ in range(ncols - len(l)):
-                    l.append("")
+                l += [""] * (ncols - len(l))
 
         if proc_sentences:
             doc = self.compute_doc(
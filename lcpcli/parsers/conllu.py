@@ -50,6 +50,12 @@ FEATURES = [
 
 
 class CONLLUParser(Parser):
+    _newdoc_id = re.compile(r"# newdoc id = (.+)")
+    _newdoc_meta = re.compile(r"# newdoc ([^=]+) = (.+)")
+    _sent_id = re.compile(r"# sent_id = (.+)")
+    _sent_meta = re.compile(r"#\s+([^=]+)\s+= (.+)")
+    _token_line = re.compile(r"\d+[\t\s]")
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.word = CustomDict()
@@ -88,13 +94,13 @@ class CONLLUParser(Parser):
         current_sentence: dict = {"meta": {}, "text": []}
         mediaSlots = self.config.get("meta", {}).get("mediaSlots", {})
         for line in sentence_lines:
-            if re.match(r"# newdoc", line):
+            if line.startswith("# newdoc"):
                 if not new_doc:
                     self.n_doc += 1
                     new_doc = {"meta": {}, "sentences": {}, "id": self.n_doc}
-                if match := re.match(r"# newdoc id = (.+)", line):
+                if match := self._newdoc_id.match(line):
                     new_doc["id"] = match[1]
-                elif match := re.match(r"# newdoc ([^=]+) = (.+)", line):
+                elif match := self._newdoc_meta.match(line):
                     key = match[1].strip()
                     value = match[2].strip()
                     if mediaSlots and key in mediaSlots:
@@ -102,11 +108,11 @@ class CONLLUParser(Parser):
                         new_doc["media"][key] = value
                     else:
                         new_doc["meta"][key] = value
-            elif match := re.match(r"# sent_id = (.+)", line):
+            elif match := self._sent_id.match(line):
                 current_sentence["id"] = match[1]
-            elif match := re.match(r"#\s+([^=]+)\s+= (.+)", line):
+            elif match := self._sent_meta.match(line):
                 current_sentence["meta"][match[1]] = match[2].strip()
-            elif re.match(r"\d+[\t\s]", line):
+            elif self._token_line.match(line):
                 line = line.split("\t")
                 line = {k: v for k, v in zip(self._features, line)}
                 current_sentence["text"].append(line)
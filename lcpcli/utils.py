@@ -5,6 +5,9 @@ import uuid
 
 from datetime import date
 
+# Output files get many short rows: only hit the disk once this many bytes are pending
+WRITE_BUFFER_SIZE = 1 << 20
+
 
 def is_time_anchored(entity: dict, config: dict) -> bool:
     if entity.get("anchoring", {}).get("time", False):
@@ -103,6 +106,8 @@ class NestedSetTreeStructure:
 class Sentence:
     _space_after = re.compile(r"(?<=SpaceAfter=)(Yes|No)")
     _frame_range = re.compile(r"(?<=start=)(\d+(.\d+)?\|end=\d+(.\d+)?)")
+    _ufeats_alternatives = re.compile(r"(\w+,\s*\w+)")
+    _ufeats_literals = re.compile(r"([\w()]+)")
 
     @staticmethod
     def valid_lines(lines):
@@ -130,13 +135,13 @@ class Sentence:
             # change angular brackets to parens
             string = string.replace("[", "(").replace("]", ")")
             # put alternatves inside JSON-array
-            string = re.sub(r"(\w+,\s*\w+)", r"[\1]", string)
+            string = Sentence._ufeats_alternatives.sub(r"[\1]", string)
             # convert pipes -separator to comma
             string = string.replace("|", ",")
             # converts equal to colon
             string = string.replace("=", ":")
             # surround literals with double quotes
-            string = re.sub(r"([\w()]+)", r'"\1"', string)
+            string = Sentence._ufeats_literals.sub(r'"\1"', string)
 
             return "{" + string + "}"
         else:
@@ -181,6 +186,9 @@ class Sentence:
         self._lines = self.valid_lines(lines)
         self.parser = parser
         self.proc_lines = []
+        # Shortest and longest line in proc_lines
+        self.min_cols = 0
+        self.max_cols = 0
         self.segment = []
         self.deprel = []
         self.fts_vector = []
@@ -322,10 +330,10 @@ class Sentence:
             self.parser.cur_idx += l_word + 1
 
             if misc:
-                if parse_misc := re.search(Sentence._space_after, misc):
+                if parse_misc := Sentence._space_after.search(misc):
                     if parse_misc[1] == "No":
                         self.parser.cur_idx -= 1
-                if frame_range := re.search(Sentence._frame_range, misc):
+                if frame_range := Sentence._frame_range.search(misc):
                     start, end = frame_range[1].split("|")
                     start = round(25.0 * float(start))
                     end = round(25.0 * float(end.lstrip("end=")))
@@ -358,6 +366,9 @@ class Sentence:
             + [(f"[{x[0]},{x[1]})" if isinstance(x, list) else x) for x in line[9:]]
             for line in token_dict.values()
         ]
+        widths = [len(l) for l in self.proc_lines]
+        self.min_cols = min(widths, default=0)
+        self.max_cols = max(widths, default=0)
 
         # build tree (if possible)
         # smth like "id IS_PARSED:"
@@ -379,9 +390,9 @@ class Sentence:
         self.parser.cur_seg = uuid.uuid4()
 
         for l in self._comments:
-            if " = " not in l:
+            k, sep, v = l.partition(" = ")
+            if not sep:
                 continue
-            k, v = l.split(" = ")
             if k.startswith("# newdoc"):
                 continue
             k = k[2:].strip()
@@ -403,16 +414,13 @@ class Sentence:
         self._process_lines()
 
 
-class Info:
-    def __init__(self, **params):
-        self.params = params
-
-
 class Table:
+    buffer_size = WRITE_BUFFER_SIZE
+
     def __init__(self, name, path, config={}):
         self.name = name
         self.path = os.path.join(path, f"{name}.csv")
-        self.file = open(self.path, "a")
+        self.file = open(self.path, "ab", buffering=self.buffer_size)
         self.config = config
         self.cursor = 1
         self.current_entity = dict()
@@ -424,29 +432,71 @@ class Table:
         self.anchor_right = 0
         self.sep = "\t"
         self.quote = f"\b"
+        self.quote_bytes = self.quote.encode("utf-8")
         self.trigger_character = "'"
         self.categorical_values: dict[str, set] = {}
+        # Indices of the columns of type "labels", and the rows that wait for
+        # the final number of labels before they can be written
+        self.label_columns: list[int] = []
+        self.pending_rows: list[list] = []
+        # Encoded lines waiting for the next call to flush
+        self.queued = bytearray()
+        # Aligned entities: memory map of the input file and (start, end) of each row
+        self.source = None
+        self.source_offsets: dict[str, tuple[int, int]] = {}
+
+    def format_row(self, row: list) -> str:
+        return self.sep.join(
+            [
+                (
+                    f"{self.quote}{str(x)}{self.quote}"
+                    if self.trigger_character in str(x)
+                    else str(x)
+                )
+                for x in row
+            ]
+        )
+
+    def encode_value(self, value: str) -> bytes:
+        """
+        Encode a single string column, quoting it like format_row would
+        """
+        if self.trigger_character in value:
+            value = f"{self.quote}{value}{self.quote}"
+        return value.encode("utf-8")
 
     def write(self, row: list):
-        self.file.write(
-            self.sep.join(
-                [
-                    (
-                        f"{self.quote}{str(x)}{self.quote}"
-                        if self.trigger_character in str(x)
-                        else str(x)
-                    )
-                    for x in row
-                ]
-            )
-            + "\n"
-        )
+        self.write_line(f"{self.format_row(row)}\n".encode("utf-8"))
+
+    def write_line(self, line: bytes):
+        """
+        Write a line that is already encoded and ends with a newline
+        """
+        # Anything queued came first: keep the rows in order
+        self.flush()
+        self.file.write(line)
+
+    def queue_line(self, line: bytes):
+        """
+        Queue a line that is already encoded and ends with a newline
+        """
+        self.queued += line
+
+    def flush(self):
+        if not self.queued:
+            return
+        self.file.write(self.queued)
+        self.queued.clear()
 
 
 class TokenTable(Table):
     def __init__(self, name, path, config={}):
         super().__init__(name, path, config)
         self.non_null_attributes = {}
+        # Lowercased names of non_null_attributes, for case-insensitive lookups
+        self.non_null_lower: set[str] = set()
+        # (attribute name, kind, table) telling how to process each of non_null_attributes
+        self.attribute_plan: list[tuple[str, str | None, Table | None]] = []
 
 
 class LookupTable(Table):
@@ -454,14 +504,17 @@ class LookupTable(Table):
         super().__init__(parent_name + "_" + own_name, path, config)
         self.write([own_name + "_id", own_name])
 
-    def get_id(self, value):
+    def get_int_id(self, value) -> int:
         id = self.texts.get(value, 0)
         if id < 1:
             id = self.cursor
             self.cursor += 1
             self.texts[value] = id
             self.write([str(id), value])
-        return str(id)
+        return id
+
+    def get_id(self, value):
+        return str(self.get_int_id(value))
 
 
 class Attribute:
@@ -563,17 +616,34 @@ class NestedSet:
         self.consumed = False
 
     def compute_anchors(self, left=1):
+        """
+        Number the left/right anchors of the tree with an iterative depth-first walk
+        """
         self.left = left
-        for c in self.children:
-            left = c.compute_anchors(left=left + 1)
-        self.right = left + 1
+        stack = [(self, iter(self.children))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            left += 1
+            if child is None:
+                node.right = left
+                stack.pop()
+            else:
+                child.left = left
+                stack.append((child, iter(child.children)))
         return self.right
 
     @property
     def all_ids(self):
-        ids = [self.id]
-        for c in self.children:
-            ids += c.all_ids
+        """
+        IDs of this node and all its descendants, in pre-order
+        """
+        ids = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            ids.append(node.id)
+            stack.extend(reversed(node.children))
         return ids
 
     def add(self, child):
@@ -583,6 +653,43 @@ class NestedSet:
         child.parent = self
 
 
+class SegmentDeps:
+    """
+    The dependencies of one segment waiting to be written, as index-parallel lists
+    """
+
+    __slots__ = (
+        "segment",
+        "document",
+        "positions",
+        "token_ids",
+        "head_ids",
+        "nested_sets",
+    )
+
+    def __init__(self, segment=None, document=None):
+        self.segment = segment
+        self.document = document
+        self.positions: dict = {}
+        self.token_ids: list = []
+        self.head_ids: list = []
+        self.nested_sets: list[NestedSet] = []
+
+    def set(self, token_id, head_id, nested_set):
+        """
+        Add a token, or replace its head and nested set if it was already added
+        """
+        idx = self.positions.get(token_id)
+        if idx is None:
+            self.positions[token_id] = len(self.token_ids)
+            self.token_ids.append(token_id)
+            self.head_ids.append(head_id)
+            self.nested_sets.append(nested_set)
+        else:
+            self.head_ids[idx] = head_id
+            self.nested_sets[idx] = nested_set
+
+
 def default_json(name):
     return {
         "meta": {